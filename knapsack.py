@@ -1,150 +1,520 @@
 import argparse
-import itertools
+import functools
+import importlib.util
+import math
+import os
+import numpy as np
+import pickle
+import sys
+import tempfile
 import toml
 import yfinance as yf
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the NumPy implementation is used.
+    njit = None
+
+try:
+    import requests_cache
+except ImportError:
+    # requests_cache is optional, without it every run queries Yahoo Finance.
+    requests_cache = None
+
+# Where the cached prices and compiled kernels are kept.
+_DATA_DIR = Path.home() / ".etf_knapsack"
+
+
+@dataclass
+class Allocation:
+    """
+    The current portfolio: the owned quantity of each ETF and the amount of
+    money in savings (`MONEY` in `info.toml`), if any.
+    """
 
+    etf_qty: dict[str, int]
+    money: float | None = None
 
-def calculate_allocation(prices: dict[str, float], budget: int, window=10):
+
+def calculate_allocation(
+    prices: dict[str, float], budget: int, window=10, top_k: int | None = None
+):
     """
     prices = current ticker prices
     budget = total amount of money to be invested
     window = result window to consider.
     Ex: If window=10, consider results between [budget-10,budget]
+    top_k = only keep the best `top_k` combinations, the ones with the fewest
+    transactions (commissions) first and then the closest to the budget.
+    If None, every combination is kept, in enumeration order. Can't be negative.
+
+    Returns the ETF names, an int32 matrix with one valid combination per
+    row, the columns being in the same order as the names, and the buy
+    price of each combination.
+    Ex: `('VUAA', 'VWCE', 'QDVE')`, `[[0, 0, 17], [0, 2, 8], ...]`,
+        `[499.97, 499.36, ...]`
     """
+    if top_k is not None and top_k < 0:
+        raise ValueError(f"top_k can't be negative, got {top_k}")
+
+    # Every amount is converted to integer units (cents, or smaller if a price
+    # has more decimals) so that the window check is exact, with no floating
+    # point rounding on the window limits.
+    scale = 10 ** _price_decimals(prices.values())
+    etfs = list(prices.keys())
+    costs = [round(cost * scale) for cost in prices.values()]
+    budget_units = round(budget * scale)
+    window_units = round(window * scale)
 
     # Get the max quantities that can be bough of each ETF given the budget.
-    max_quantities: dict[str, int] = {}
-    for etf, cost in prices.items():
-        # The budget will include the upper limit of the window.
-        max_quantities[etf] = int((budget + window) // cost)
+    # The budget will include the upper limit of the window.
+    max_quantities = [(budget_units + window_units) // cost for cost in costs]
+
+    # The most that can still be spent by the ETFs from index `i` onwards.
+    # Used to discard a branch when even buying the maximum of every remaining
+    # ETF would not reach the lower limit of the window.
+    max_tail_spend = [0] * (len(costs) + 1)
+    for i in range(len(costs) - 1, -1, -1):
+        max_tail_spend[i] = max_tail_spend[i + 1] + max_quantities[i] * costs[i]
+
+    if njit is not None:
+        kernel = _allocation_kernel(len(costs))
+        valid, totals = kernel(
+            np.array(costs, dtype=np.int64),
+            np.array(max_quantities, dtype=np.int64),
+            np.array(max_tail_spend, dtype=np.int64),
+            budget_units,
+            window_units,
+        )
+    else:
+        valid, totals = _enumerate_allocations(
+            costs, max_quantities, max_tail_spend, budget_units, window_units
+        )
 
-    # Create a list of range objects, one for each ETF
-    quantity_ranges: dict[str, range] = {}
-    for etf, mq in max_quantities.items():
-        quantity_ranges[etf] = range(mq + 1)
+    if top_k is not None:
+        # Rank by number of transactions, then by distance to the budget, which
+        # is at most `window_units`, so both fit in a single integer.
+        transactions = np.count_nonzero(valid, axis=1)
+        rank = transactions * (window_units + 1) + np.abs(totals - budget_units)
 
-    # Generate all possible combinations of the varying
-    # quantities of the ETFs calculated in the previous steps
-    # Ex: [(2, 0, 6), (2, 0, 7), (2, 1, 0), (2, 1, 1),,...]
-    # The order of the tuples is the same as the dictionary keys, since python
-    # maintains the read order on every iteration. see: `product_to_combination`
-    products = list(itertools.product(*quantity_ranges.values()))
-    all_combinations = product_to_combination(prices, products)
+        # Only the `top_k` best are sorted, the rest are just discarded.
+        # Combinations with the same rank keep their enumeration order.
+        best = np.arange(len(valid))
+        if top_k < len(valid):
+            best = best[:0]
+            if top_k > 0:
+                kth = np.partition(rank, top_k - 1)[top_k - 1]
+                ties = np.flatnonzero(rank == kth)
+                best = np.flatnonzero(rank < kth)
+                best = np.concatenate((best, ties[: top_k - len(best)]))
+        best = best[np.argsort(rank[best], kind="stable")]
+        valid, totals = valid[best], totals[best]
 
-    valid_combinations: list[dict[str, int]] = []
-    for comb in all_combinations:
-        price = calculate_buy_price(prices, comb)
+    return tuple(etfs), valid, totals / scale
 
-        # combination can be purchased given the budget
-        if price >= (budget - window) and price <= (budget + window):
-            valid_combinations.append(comb)
 
-    return valid_combinations
+# Most decimal places used for the integer units of `calculate_allocation`.
+_MAX_PRICE_DECIMALS = 6
 
 
-def product_to_combination(prices: dict[str, float], products: list[tuple[int, ...]]):
+def _price_decimals(prices: Iterable[float]) -> int:
     """
-    For every product with the various quantities of the ETFs,
-    associate said quantities to the corresponding ETF.
-    This hinges on the fact that every read of a python dictionary
-    is the same on every read operation, i.e., the order of the keys of the dictionary in this function
-    will be in the same order from when we calculated the various quantities previously, allowing us
-    to map the quantities to the keys.
-    Ex: `{'VUAA': 2, 'VWCE': 0, 'QDVE': 2}`
+    Number of decimal places needed to represent every price exactly, at least
+    2 (cents) and at most `_MAX_PRICE_DECIMALS`.
+    Ex: `104.165` and `29.41` need 3.
     """
+    decimals = 2
+    for price in prices:
+        exponent = Decimal(repr(float(price))).as_tuple().exponent
+        decimals = max(decimals, -int(exponent))
+
+    return min(decimals, _MAX_PRICE_DECIMALS)
 
-    combinations: list[dict[str, int]] = []
-    for product in products:
-        combinations.append(dict(zip(prices.keys(), product)))
 
-    return combinations
+# Most partial combinations `_enumerate_allocations` expands at once. Bounds
+# its memory use, which would otherwise grow with the number of combinations.
+_BATCH_ROWS = 1 << 16
 
 
-def calculate_buy_price(prices: dict[str, float], combination: dict[str, int]):
-    """Calculate the total amount that
-    would be spent of the budget if this
-    combination were to take place
+def _enumerate_allocations(
+    costs: list[int],
+    max_quantities: list[int],
+    max_tail_spend: list[int],
+    budget: int,
+    window: int,
+) -> tuple[np.ndarray, np.ndarray]:
     """
+    NumPy implementation of the enumeration, used when numba is not installed.
+    Every amount is in the integer units of `calculate_allocation`.
+    Returns an int32 matrix with one valid combination per row, the columns
+    being in the same order as the ETFs in `costs`, and the total spent by
+    each combination.
+    """
+    low = budget - window
+    high = budget + window
+
+    # Branch and bound over the ETFs, one ETF (level) at a time, in the same
+    # order as the dictionary keys. Every row of `quantities` is a partial
+    # combination and `totals` holds what it spends so far. At each level, a
+    # row is only expanded with the quantities that can still end up inside
+    # [budget-window, budget+window], so whole subtrees of the combinations
+    # that `itertools.product` would generate are never built.
+    def expand(quantities: np.ndarray, totals: np.ndarray, idx: int):
+        if idx == len(costs):
+            # combination can be purchased given the budget
+            valid = np.abs(totals - budget) <= window
+            return [(quantities[valid], totals[valid])]
+
+        # ceil((low - spent - max_tail_spend) / cost) and floor((high - spent) / cost),
+        # exact since everything is an integer.
+        cost = costs[idx]
+        qmin = np.maximum(-((totals + max_tail_spend[idx + 1] - low) // cost), 0)
+        qmax = np.minimum((high - totals) // cost, max_quantities[idx])
+        counts = np.maximum(qmax - qmin + 1, 0)
+        ends = np.cumsum(counts)
+
+        # The rows are expanded in batches of about `_BATCH_ROWS` new rows, each
+        # batch going through the remaining ETFs before the next one is built.
+        found: list[tuple[np.ndarray, np.ndarray]] = []
+        start = 0
+        while start < len(counts):
+            limit = ends[start] - counts[start] + _BATCH_ROWS
+            stop = max(start + 1, int(np.searchsorted(ends, limit, side="right")))
+            batch = counts[start:stop]
+
+            # Expand every row into `counts[row]` rows, one per quantity tried.
+            # Ex: qmin=[0, 2], counts=[2, 3] gives rows=[0, 0, 1, 1, 1], q=[0, 1, 2, 3, 4]
+            rows = np.repeat(np.arange(start, stop), batch)
+            offsets = np.repeat(np.cumsum(batch) - batch, batch)
+            q = qmin[rows] + (np.arange(len(rows)) - offsets)
+
+            found += expand(
+                np.column_stack((quantities[rows], q.astype(np.int32))),
+                totals[rows] + q * cost,
+                idx + 1,
+            )
+            start = stop
+
+        return found
+
+    found = expand(np.zeros((1, 0), dtype=np.int32), np.zeros(1, dtype=np.int64), 0)
+    if not found:
+        return np.zeros((0, len(costs)), dtype=np.int32), np.zeros(0, dtype=np.int64)
+    return np.concatenate([q for q, _ in found]), np.concatenate([t for _, t in found])
 
-    total = 0.0
-    for etf, quantity in combination.items():
-        total += quantity * prices[etf]
 
-    return total
+# Compiled enumeration kernels, one per number of ETFs.
+_kernels: dict[int, Callable[..., tuple[np.ndarray, np.ndarray]]] = {}
 
 
-def calculate_commission(combination: dict[str, int]):
+def _allocation_kernel(n: int) -> Callable[..., tuple[np.ndarray, np.ndarray]]:
+    """
+    Numba does not support `itertools.product`, so the enumeration is generated
+    as `n` nested loops, each one only going through the quantities that can
+    still end up inside the window (the same bounds as `_enumerate_allocations`).
+    Ex, for n=2:
+        p0 = 0
+        for q0 in range(...):
+            p1 = p0 + q0 * costs[0]
+            for q1 in range(...):
+                p2 = p1 + q1 * costs[1]
+                if abs(p2 - budget) <= window:
+                    ...
+    The source is written to a module in `~/.etf_knapsack/kernels` and compiled
+    with `cache=True`, so numba keeps the compiled kernel on disk and only the
+    very first run pays for the compilation. If that is not possible (e.g. the
+    home directory is read-only), the kernel is compiled in memory instead, on
+    every run. Loaded kernels are kept in `_kernels`.
+    """
+    if n in _kernels:
+        return _kernels[n]
+
+    lines = [
+        "def kernel(costs, max_q, max_tail_spend, budget, window):",
+        "    low = budget - window",
+        "    high = budget + window",
+        f"    out = np.empty((64, {n}), dtype=np.int32)",
+        "    out_totals = np.empty(64, dtype=np.int64)",
+        "    k = 0",
+        "    p0 = 0",
+    ]
+    indent = "    "
+    for i in range(n):
+        lines += [
+            f"{indent}qmin = max(0, -((p{i} + max_tail_spend[{i + 1}] - low) // costs[{i}]))",
+            f"{indent}qmax = min(max_q[{i}], (high - p{i}) // costs[{i}])",
+            f"{indent}for q{i} in range(qmin, qmax + 1):",
+            f"{indent}    p{i + 1} = p{i} + q{i} * costs[{i}]",
+        ]
+        indent += "    "
+    lines += [
+        f"{indent}if abs(p{n} - budget) <= window:",
+        f"{indent}    if k == out.shape[0]:",
+        f"{indent}        grown = np.empty((2 * k, {n}), dtype=np.int32)",
+        f"{indent}        grown[:k] = out",
+        f"{indent}        out = grown",
+        f"{indent}        grown_totals = np.empty(2 * k, dtype=np.int64)",
+        f"{indent}        grown_totals[:k] = out_totals",
+        f"{indent}        out_totals = grown_totals",
+    ]
+    lines += [f"{indent}    out[k, {i}] = q{i}" for i in range(n)]
+    lines += [
+        f"{indent}    out_totals[k] = p{n}",
+        f"{indent}    k += 1",
+        "    return out[:k], out_totals[:k]",
+    ]
+
+    source = "\n".join(lines) + "\n"
+    try:
+        _kernels[n] = _load_cached_kernel(n, source)
+    except (OSError, ImportError, RuntimeError):
+        namespace: dict[str, Any] = {"np": np}
+        exec(source, namespace)
+        _kernels[n] = njit(namespace["kernel"])
+
+    return _kernels[n]
+
+
+def _load_cached_kernel(n: int, source: str) -> Callable[..., Any]:
+    """
+    Write the kernel `source` to `~/.etf_knapsack/kernels` and import it from
+    there, compiled with `njit(cache=True)`.
+    """
+    source = (
+        "import numpy as np\nfrom numba import njit\n\n\n@njit(cache=True)\n" + source
+    )
+
+    # numba invalidates its cache when the file changes, so it is only written
+    # when the generated source is different. It is written to a temporary file
+    # first and then moved into place, so another run never reads half a file.
+    path = _DATA_DIR / "kernels" / f"allocation_{n}.py"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not path.exists() or path.read_text() != source:
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(source)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    # numba needs to be able to import the module by name to load its cache, so
+    # it is registered in `sys.modules`, but only once it has loaded.
+    name = f"etf_knapsack_allocation_{n}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Can't load the kernel module {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+
+    return module.kernel
+
+
+def calculate_commission(combination: list[int]):
     """
     In IBKR, for each transaction, the normal commission
     is of 1,25€
     """
 
     # Get the number of bought ETFs thats greater than 0, which means a transaction
-    transactions = sum(i > 0 for i in combination.values())
+    transactions = sum(i > 0 for i in combination)
 
     return transactions * 1.25
 
 
 def calculate_new_balance(
-    prices: dict[str, float], allocation: dict[str, int], combination: dict[str, int]
+    prices: dict[str, float],
+    allocation: Allocation,
+    etfs: tuple[str, ...],
+    combinations: np.ndarray,
 ):
     """
     Calculate portfolio balance with the new ETF ammount.
-    This will give the weight for each ETF if a given combination choice is taken.
+    This will give the weight for each ETF if a given combination choice is taken,
+    for every combination at once.
+    Returns the names of the positions and a matrix with the weights of every
+    combination, one row per row of `combinations`.
+    Ex: `('VUAA', 'VWCE', 'QDVE', 'MONEY')`, `[[24.54, 20.73, 15.47, 39.26], ...]`
     """
-    # Calculate the total amount of value this allocation would have if this combinations
-    # were to be bought so that we can calculate the weight after.
-    total_money = 0.0
-    for etf, quantity in allocation.items():
-        # Money quantity is a special case
-        if etf == "MONEY":
-            total_money += quantity
-        else:
-            total_money += (quantity + combination[etf]) * prices[etf]
+    names = tuple(allocation.etf_qty)
 
-    new_weights: dict[str, float] = {}
-    for etf, quantity in allocation.items():
-        # Money quantity is a special case
-        if etf == "MONEY":
-            new_weights[etf] = (quantity / total_money) * 100
-        else:
-            new_weights[etf] = (
-                ((quantity + combination[etf]) * prices[etf]) / total_money
-            ) * 100
+    # The quantities of each combination, with the columns in the same order
+    # as the allocation, plus what is already owned.
+    columns = [etfs.index(etf) for etf in names]
+    owned = np.array(list(allocation.etf_qty.values()), dtype=np.int64)
+    quantities = combinations[:, columns] + owned
 
-    return new_weights
+    # Calculate the value each position would have if this combinations were to be
+    # bought, and the total amount of value of the allocation, so that we can
+    # calculate the weight after.
+    values = quantities * np.array([prices[etf] for etf in names], dtype=np.float64)
+    total_money = values.sum(axis=1)
 
+    # Money quantity is a special case, it does not change with the combination.
+    if allocation.money is not None:
+        names += ("MONEY",)
+        total_money += allocation.money
+        money = np.full((len(combinations), 1), allocation.money, dtype=np.float64)
+        values = np.hstack((values, money))
 
-def calculate_current_balance(prices: dict[str, float], allocation: dict[str, int]):
+    new_weights = (values / total_money[:, None]) * 100
+
+    return names, new_weights
+
+
+def calculate_current_balance(prices: dict[str, float], allocation: Allocation):
     """
     Calculate the current portfolio balance.
     """
 
+    # Value of each position and total value of the allocation, in a single pass.
+    values: dict[str, float] = {}
     total_money = 0.0
-    for etf, quantity in allocation.items():
-        # Money quantity is a special case
-        if etf == "MONEY":
-            total_money += quantity
-        else:
-            total_money += quantity * prices[etf]
-
-    weights: dict[str, float] = {}
-    for etf, quantity in allocation.items():
-        # Money quantity is a special case
-        if etf == "MONEY":
-            weights[etf] = (quantity / total_money) * 100
-        else:
-            weights[etf] = ((quantity * prices[etf]) / total_money) * 100
+    for etf, quantity in allocation.etf_qty.items():
+        value = quantity * prices[etf]
+        values[etf] = value
+        total_money += value
+
+    if allocation.money is not None:
+        values["MONEY"] = allocation.money
+        total_money += allocation.money
+
+    weights = {etf: (value / total_money) * 100 for etf, value in values.items()}
 
     return weights, total_money
 
 
+@functools.lru_cache(maxsize=None)
+def _session():
+    """
+    HTTP session shared by every ticker. When requests_cache is installed,
+    Yahoo Finance responses are kept on disk (`~/.etf_knapsack/yf_cache.sqlite`)
+    for an hour, so running the script again shortly after does not hit the network.
+    If that directory can't be created, the responses are not cached.
+    """
+    if requests_cache is None:
+        return None
+    try:
+        _DATA_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return requests_cache.CachedSession(str(_DATA_DIR / "yf_cache"), expire_after=3600)
+
+
+@functools.lru_cache(maxsize=128)
+def _ticker(ticker: str):
+    """
+    One `yf.Ticker` per symbol. The ticker keeps the `.info` it already
+    fetched, so asking for the same symbol again does not query it twice.
+    """
+    return yf.Ticker(ticker, session=_session())
+
+
+def get_ticker_price(ticker: str) -> float | None:
+    # get the current bid price
+    return _ticker(ticker).info.get("bid")
+
+
+def is_valid_price(price: Any) -> bool:
+    """
+    Yahoo Finance returns a bid of `0.0` or `None` for some tickers, e.g. XETRA
+    ones outside trading hours. Those can't be used, nor cached.
+    """
+    return (
+        isinstance(price, (int, float))
+        and not isinstance(price, bool)
+        and math.isfinite(price)
+        and price > 0
+    )
+
+
+def load_cached_prices() -> dict[str, float]:
+    """
+    Prices already fetched today, by ticker. Empty if there are none.
+    Invalid prices are left out, so they are fetched again.
+    """
+    try:
+        with open(_prices_cache_path(), "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+    return {ticker: price for ticker, price in cached.items() if is_valid_price(price)}
+
+
+def save_cached_prices(prices: dict[str, float]):
+    """
+    Save the prices fetched today, by ticker, and remove the ones of previous days.
+    The file is written under a temporary name and then renamed, so a run
+    started at the same time never reads a truncated file.
+    """
+    path = _prices_cache_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for old in path.parent.glob("prices_*.pkl"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(prices, f)
+        os.replace(tmp, path)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+def _prices_cache_path() -> Path:
+    return _DATA_DIR / f"prices_{date.today():%Y%m%d}.pkl"
+
+
 def get_ticker_prices(tickers: dict[str, str]):
+    """
+    The prices are only fetched once per day, and kept in `~/.etf_knapsack`,
+    so running the script again on the same day does not hit the network.
+    Every price is a blocking request to Yahoo Finance, so they are fetched
+    concurrently. The number of workers is capped to stay clear of the
+    Yahoo Finance rate limits.
+    Only valid prices are cached, a ValueError is raised for the others.
+    If `~/.etf_knapsack` can't be written, the prices are used uncached.
+    """
+    cached = load_cached_prices()
+    missing = [ticker for ticker in tickers.values() if ticker not in cached]
+    if missing:
+        workers = min(8, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = dict(zip(missing, executor.map(get_ticker_price, missing)))
+
+        invalid = {
+            t: price for t, price in fetched.items() if not is_valid_price(price)
+        }
+        valid = {t: price for t, price in fetched.items() if t not in invalid}
+        if valid:
+            cached.update(valid)
+            try:
+                save_cached_prices(cached)
+            except OSError:
+                # The prices are still good, they just get fetched again next run.
+                pass
+        if invalid:
+            raise ValueError(
+                "No valid bid price from Yahoo Finance for "
+                + ", ".join(f"{t} ({price!r})" for t, price in invalid.items())
+                + ". The market may be closed, try again later."
+            )
+
     prices: dict[str, float] = {}
     for etf, ticker in tickers.items():
-        # get the current bid price
-        prices[etf] = yf.Ticker(ticker).info["bid"]
+        prices[etf] = cached[ticker]
 
     return prices
 
@@ -162,24 +532,40 @@ def load_info() -> dict[str, Any]:
     return toml.load("info.toml")
 
 
+def parse_allocation(allocation: dict[str, Any]) -> Allocation:
+    """
+    Split the `[allocation]` table of `info.toml` into the ETF quantities and
+    the money in savings, which is optional.
+    """
+    etf_qty = {etf: quantity for etf, quantity in allocation.items() if etf != "MONEY"}
+
+    return Allocation(etf_qty, allocation.get("MONEY"))
+
+
 def print_combinations(
     prices: dict[str, float],
-    quantity: dict[str, int],
-    combinations: list[dict[str, int]],
+    allocation: Allocation,
+    etfs: tuple[str, ...],
+    combinations: np.ndarray,
+    buy_prices: np.ndarray,
     balance: dict[str, float],
 ):
     """
     Pretty print the options and possible buy combinations given the budget.
+    The `buy_prices` argument holds the buy prices from `calculate_allocation`.
     The `balance` argument is the current balance so we can calculate the delta.
     """
-    for idx, comb in enumerate(combinations):
-        new_weights = calculate_new_balance(prices, quantity, comb)
-        buy_price = calculate_buy_price(prices, comb)
+    # The new balance of every combination is calculated at once, so only
+    # the formatting is left for each option.
+    names, new_weights = calculate_new_balance(prices, allocation, etfs, combinations)
+    for idx, (comb, buy_price, weights) in enumerate(
+        zip(combinations.tolist(), buy_prices.tolist(), new_weights.tolist())
+    ):
         commissions = calculate_commission(comb)
         print(
             f"---------------------------------------------------------------",
             f"\nOpt. {idx + 1} | Buying",
-            ", ".join([f"{ammount} {etf}" for etf, ammount in comb.items()]),
+            ", ".join([f"{ammount} {etf}" for etf, ammount in zip(etfs, comb)]),
             f"would use {buy_price:,.2f}€",
             f"with +{commissions:,.2f}€ commission",
             f"for {(buy_price + commissions):,.2f}€ total."
@@ -187,25 +573,27 @@ def print_combinations(
             " | ".join(
                 [
                     f"{etf}: {weight:.2f}%({delta(weight, balance[etf])}%)"
-                    for etf, weight in new_weights.items()
+                    for etf, weight in zip(names, weights)
                 ]
             ),
         )
 
 
 def update_allocation_file(
-    allocation: dict[str, Any], combinations: list[dict[str, int]], comb: int
+    allocation: dict[str, Any],
+    etfs: tuple[str, ...],
+    combinations: np.ndarray,
+    comb: int,
 ):
+    chosen = dict(zip(etfs, combinations[comb - 1].tolist()))
     print(
         f"---------------------------------------------------------------",
         f"\nOpt. {comb} | Buying",
-        ", ".join(
-            [f"{ammount} {etf}" for etf, ammount in combinations[comb - 1].items()]
-        ),
+        ", ".join([f"{ammount} {etf}" for etf, ammount in chosen.items()]),
     )
     confirm = input("Confirm this option? [y/n]: ")
     if confirm == "y":
-        for etf, ammount in combinations[comb - 1].items():
+        for etf, ammount in chosen.items():
             allocation["allocation"][etf] += ammount
 
         # Write to file
@@ -222,14 +610,25 @@ if __name__ == "__main__":
         help="Result window to consider. ex: If window=10, consider results between [budget-10,budget]",
         default=10,
     )
+    parser.add_argument(
+        "--top",
+        help="Only show the best N options: fewest transactions first, then closest to the budget",
+        type=int,
+    )
     args = parser.parse_args()
+    if args.top is not None and args.top < 1:
+        parser.error("--top must be 1 or more")
 
     if args.budget:
         w = int(args.window)
         b = int(args.budget)
         info = load_info()
-        prices = get_ticker_prices(info["tickers"])
-        balance, total_money = calculate_current_balance(prices, info["allocation"])
+        allocation = parse_allocation(info["allocation"])
+        try:
+            prices = get_ticker_prices(info["tickers"])
+        except ValueError as e:
+            sys.exit(str(e))
+        balance, total_money = calculate_current_balance(prices, allocation)
 
         print(
             "ETFs Price:",
@@ -243,17 +642,20 @@ if __name__ == "__main__":
         print(
             f"Performing calculations with Budget = {args.budget}€ and Window = {args.window}€"
         )
-        combinations = calculate_allocation(prices, budget=b, window=w)
-        print_combinations(prices, info["allocation"], combinations, balance)
+        etfs, combinations, buy_prices = calculate_allocation(
+            prices, budget=b, window=w, top_k=args.top
+        )
+        print_combinations(prices, allocation, etfs, combinations, buy_prices, balance)
         # Automatically update allocation file if an order is chosen.
         order = input("\nPlacing an Order? [y/n]: ")
         if order == "y":
             # Update values
             comb = int(input("Which option?: "))
-            update_allocation_file(info, combinations, comb)
+            update_allocation_file(info, etfs, combinations, comb)
             # Show new allocation
             info = load_info()
-            balance, total_money = calculate_current_balance(prices, info["allocation"])
+            allocation = parse_allocation(info["allocation"])
+            balance, total_money = calculate_current_balance(prices, allocation)
             print(
                 "New Portfolio Allocation:",
                 " | ".join(
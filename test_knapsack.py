@@ -0,0 +1,116 @@
+"""
+Compares `calculate_allocation` against a brute force search on small random
+inputs, for both the numba kernel and the NumPy implementation.
+Run with `python -m unittest test_knapsack`.
+"""
+
+import itertools
+import random
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+import numpy as np
+
+import knapsack
+
+
+def brute_force(prices: dict[str, float], budget: int, window: int):
+    """
+    Every combination of `itertools.product` spending within the window, in
+    exact arithmetic, with the buy price of each one.
+    """
+    costs = [Fraction(repr(price)) for price in prices.values()]
+    ranges = [range(int((budget + window) // cost) + 1) for cost in costs]
+    found = []
+    for combination in itertools.product(*ranges):
+        total = sum(q * cost for q, cost in zip(combination, costs))
+        if abs(total - budget) <= window:
+            found.append((combination, total))
+    return found
+
+
+def random_prices(rng: random.Random, decimals: int) -> dict[str, float]:
+    """
+    Between 1 and 4 prices with up to `decimals` decimal places. Some are
+    multiples of 0.125, so that totals land exactly on the window limits.
+    """
+    prices = {}
+    for i in range(rng.randint(1, 4)):
+        if rng.random() < 0.3:
+            price = rng.randint(8, 800) * 0.125
+        else:
+            price = round(rng.uniform(1, 120), decimals)
+        prices[f"ETF{i}"] = max(price, 1.0)
+    return prices
+
+
+class CalculateAllocationTest(unittest.TestCase):
+    CASES = 150
+
+    def run_backend(self, prices, budget, window, numpy_only: bool):
+        if not numpy_only:
+            return knapsack.calculate_allocation(prices, budget, window)
+        # A small batch size also covers the batching of `_enumerate_allocations`.
+        with mock.patch.object(knapsack, "njit", None), mock.patch.object(
+            knapsack, "_BATCH_ROWS", 7
+        ):
+            return knapsack.calculate_allocation(prices, budget, window)
+
+    def backends(self) -> list[bool]:
+        if knapsack.njit is None:
+            return [True]
+        return [True, False]
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1234)
+        for case in range(self.CASES):
+            prices = random_prices(rng, decimals=2 if case % 2 else 3)
+            budget = rng.randint(0, 150)
+            window = rng.randint(0, 10)
+            expected = brute_force(prices, budget, window)
+
+            results = []
+            for numpy_only in self.backends():
+                with self.subTest(
+                    prices=prices, budget=budget, window=window, numpy=numpy_only
+                ):
+                    etfs, valid, totals = self.run_backend(
+                        prices, budget, window, numpy_only
+                    )
+                    self.assertEqual(etfs, tuple(prices))
+                    self.assertEqual(
+                        [tuple(row) for row in valid.tolist()],
+                        [combination for combination, _ in expected],
+                    )
+                    np.testing.assert_allclose(
+                        totals, [float(total) for _, total in expected], atol=1e-9
+                    )
+                    results.append((valid, totals))
+
+            for valid, totals in results[1:]:
+                np.testing.assert_array_equal(valid, results[0][0])
+                np.testing.assert_array_equal(totals, results[0][1])
+
+    def test_window_limits(self):
+        # 0.125 * 8 = 1 exactly, so 96 and 104 units sit on the window limits.
+        prices = {"A": 0.125, "B": 2.5}
+        for numpy_only in self.backends():
+            with self.subTest(numpy=numpy_only):
+                _, valid, totals = self.run_backend(prices, 12, 1, numpy_only)
+                expected = brute_force(prices, 12, 1)
+                self.assertEqual(len(valid), len(expected))
+                self.assertEqual(totals.min(), 11.0)
+                self.assertEqual(totals.max(), 13.0)
+
+
+class PriceDecimalsTest(unittest.TestCase):
+    def test_price_decimals(self):
+        self.assertEqual(knapsack._price_decimals([104.16, 29.4]), 2)
+        self.assertEqual(knapsack._price_decimals([104.165, 29.41]), 3)
+        self.assertEqual(knapsack._price_decimals([0.125]), 3)
+        self.assertEqual(knapsack._price_decimals([1.123456789]), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()